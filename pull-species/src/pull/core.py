@@ -1,49 +1,509 @@
-from Bio import Entrez, SeqIO
+from Bio import SeqIO
 
 from dotenv import load_dotenv
 
+import aiohttp
+
+import argparse
+import asyncio
+import io
 import os
 import json
+import random
+import re
+import sqlite3
+import time
+
+from xml.etree import ElementTree
 
 load_dotenv()
 email = os.getenv("ENTREZ_EMAIL")
 api_key = os.getenv("ENTREZ_API_KEY")
 
-Entrez.email = email
-Entrez.api_key = api_key
+EUTILS = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+
+# efetch accepts a comma separated id list, so records are pulled in batches
+FETCH_BATCH_SIZE = 200
+
+# accessions posted to the history server are fetched back in ranged pages,
+# which can be larger since the ids no longer travel in the url
+HISTORY_PAGE_SIZE = 500
+
+# ncbi allows 10 requests per second with an api key, and only 3 without; each
+# request reserves its own evenly spaced send time so bursts never go over, and
+# only once it holds one of MAX_REQUESTS slots, so that a request never queues for
+# a pooled connection after its send time has already been reserved
+MAX_REQUESTS = 10 if api_key else 3
+_next_request_at = 0.0
+_request_slots = None
+
+# ncbi answers 429 when we go over the rate limit and the odd 5xx under load,
+# both of which usually succeed when tried again a little later
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.5
+MAX_RETRY_DELAY = 8.0
+
+# everything a fetch can fail with once its retries are used up, including the
+# ValueErrors raised for responses which cannot be parsed
+FETCH_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+# search hits are narrowed down to the smallest record holding the whole gene,
+# rather than whatever ncbi happened to list first; records titled as partial are
+# dropped outright, and since a complete COX3 CDS is about 784 bp the floor sits a
+# little below that to allow for differences between taxa
+MIN_RECORD_LENGTH = 700
+
+# genbank records never change for a given accession.version, so responses are
+# kept on disk and re-runs only hit the network for new species; delete the
+# file to pick up new search results
+CACHE_PATH = "entrez_cache.sqlite"
+_cache = None
+
+def open_cache(path=CACHE_PATH):
+  """
+  Opens the sqlite cache of E-utility responses, creating its tables if they do
+  not exist yet...
+
+  @param path (str): The path of the sqlite database (default is CACHE_PATH)
+
+  @returns (sqlite3.Connection): A connection to the cache
+  """
+  cache = sqlite3.connect(path)
+  cache.executescript("""
+    CREATE TABLE IF NOT EXISTS search (
+      species TEXT,
+      gene TEXT,
+      ids TEXT,
+      PRIMARY KEY (species, gene)
+    );
+    CREATE TABLE IF NOT EXISTS gb (
+      accession TEXT PRIMARY KEY,
+      record BLOB,
+      fetched_at INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS cds (
+      accession TEXT PRIMARY KEY,
+      record BLOB,
+      fetched_at INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS docsum (
+      accession TEXT PRIMARY KEY,
+      record BLOB,
+      fetched_at INTEGER
+    );
+  """)
+  return cache
+
+def _get_cache():
+  global _cache
+  if _cache is None:
+    _cache = open_cache()
+  return _cache
+
+# table is always one of our own table names, never user input
+def _cached_record(table, accession):
+  row = _get_cache().execute(f"SELECT record FROM {table} WHERE accession = ?", (accession,)).fetchone()
+  return None if row is None else row[0]
+
+def _cache_record(table, accession, record):
+  with _get_cache() as cache:
+    cache.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", (accession, record, int(time.time())))
+
+def _split_cached(table, accessions, decode):
+  # decode turns a cached record back into the value the fetcher returns
+  found = {}
+  missing = []
+  for accession in accessions:
+    record = _cached_record(table, accession)
+    if record is None:
+      missing.append(accession)
+    else:
+      found[accession] = decode(record)
+  return found, missing
+
+def _split_genbank(text):
+  # each record in a concatenated flat file is terminated by a "//" line
+  records = re.split(r"^//[ \t]*$\n?", text, flags=re.MULTILINE)
+  return [record + "//\n" for record in records if record.strip()]
+
+def make_session():
+  """
+  Creates the HTTP session used for every E-utility request, keeping a pool of
+  connections to eutils alive so that each request skips the TCP and TLS
+  handshakes; the pool size also caps how many requests are in flight...
+
+  @returns (aiohttp.ClientSession): A session with a pooled connector, which
+    must be created inside of a running event loop
+  """
+  connector = aiohttp.TCPConnector(limit=MAX_REQUESTS, ttl_dns_cache=300, keepalive_timeout=30)
+  timeout = aiohttp.ClientTimeout(total=120)
+  return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def _get_request_slots():
+  global _request_slots
+  # a semaphore belongs to the event loop it was first used on, so each
+  # asyncio.run gets a fresh one
+  loop = asyncio.get_running_loop()
+  if _request_slots is None or _request_slots[0] is not loop:
+    _request_slots = (loop, asyncio.Semaphore(MAX_REQUESTS))
+  return _request_slots[1]
+
+async def _wait_for_rate_limit():
+  """
+  Waits until the next free send time, spacing requests 1 / MAX_REQUESTS
+  seconds apart no matter how many are queued up at once...
+  """
+  global _next_request_at
+  # no await between reading and bumping the send time, so this is safe across
+  # tasks without a lock
+  now = time.monotonic()
+  send_at = max(now, _next_request_at)
+  _next_request_at = send_at + 1 / MAX_REQUESTS
+  await asyncio.sleep(send_at - now)
+
+async def _eutils_request(session, endpoint, params, method="GET"):
+  """
+  Sends a request to one of the NCBI E-utilities, waiting for its turn first so
+  that we stay under the rate limit, and retrying rate limited, server error
+  and dropped connection responses up to MAX_ATTEMPTS times...
+
+  @param session (aiohttp.ClientSession): The session to send the request with
+  @param endpoint (str): The E-utility to call, such as "esearch.fcgi"
+  @param params (dict): The parameters for the E-utility
+  @param method (str): Either "GET", or "POST" to send the parameters as a form
+    body for long id lists (default is "GET")
+
+  @returns (str): The body of the response
+  """
+  params = {**params, "email": email, "api_key": api_key}
+  params = {key: value for key, value in params.items() if value is not None}
+  if method == "POST":
+    request = {"data": params}
+  else:
+    request = {"params": params}
+  for attempt in range(1, MAX_ATTEMPTS + 1):
+    # the slot is held until the response is read, so a connection is always free
+    # by the time the rate limit lets the request go
+    async with _get_request_slots():
+      await _wait_for_rate_limit()
+      try:
+        async with session.request(method, EUTILS + endpoint, **request) as response:
+          status = response.status
+          if status not in RETRY_STATUSES or attempt == MAX_ATTEMPTS:
+            response.raise_for_status()
+            return await response.text()
+          delay = _retry_delay(attempt, response.headers.get("Retry-After"))
+          if status == 429:
+            _hold_off_requests(delay)
+      except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+        if attempt == MAX_ATTEMPTS:
+          raise
+        delay = _retry_delay(attempt)
+    await asyncio.sleep(delay)
+
+def _hold_off_requests(delay):
+  global _next_request_at
+  # a 429 means the whole client is going too fast, so every other request waits
+  # out the delay as well rather than carrying on at the full rate
+  _next_request_at = max(_next_request_at, time.monotonic() + delay)
 
-def search_species_sequences(species_name, gene_name="COX3", retmax=10):
+def _retry_delay(attempt, retry_after=None):
+  # honour the server's Retry-After when given in seconds, up to MAX_RETRY_DELAY,
+  # otherwise back off exponentially with some jitter so queued requests do not
+  # retry in lockstep
+  if retry_after is not None and retry_after.isdigit():
+    return min(MAX_RETRY_DELAY, float(retry_after))
+  delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+  return min(MAX_RETRY_DELAY, delay + random.uniform(0, RETRY_BACKOFF))
+
+async def search_species_sequences(session, species_name, gene_name="COX3", retmax=10):
   """
   Searches for nucleotide sequences of a specific gene in a given species.
 
+  @param session (aiohttp.ClientSession): The session to send the request with
   @param species_name (str): The scientific name of the species
   @param gene_name (str): The gene of interest (default is "COX3")
   @param retmax (int): Maximum number of records to retrieve (default is 10)
 
   @returns (list): A list of GenBank accession numbers
   """
+  cache = _get_cache()
+  row = cache.execute(
+    "SELECT ids FROM search WHERE species = ? AND gene = ?", (species_name, gene_name)
+  ).fetchone()
+  if row is not None:
+    return json.loads(row[0])
+
   search_term = f"{species_name}[Organism] AND {gene_name}[Gene]"
-  handle = Entrez.esearch(db="nucleotide", term=search_term, retmax=retmax)
-  record = Entrez.read(handle)
-  handle.close()
-  return record["IdList"]
+  try:
+    # idtype="acc" gives accession.version ids, which is what SeqRecord.id holds
+    text = await _eutils_request(session, "esearch.fcgi", {
+      "db": "nucleotide",
+      "term": search_term,
+      "retmax": retmax,
+      "idtype": "acc",
+      "retmode": "json",
+    })
+    ids = json.loads(text)["esearchresult"]["idlist"]
+  except (*FETCH_ERRORS, KeyError):
+    # not cached, so the next run searches for this species again
+    print(f"Failed to search for {species_name}...")
+    return []
+  with cache:
+    cache.execute("INSERT OR REPLACE INTO search VALUES (?, ?, ?)", (species_name, gene_name, json.dumps(ids)))
+  return ids
+
+async def summarize_accessions(session, accessions):
+  """
+  Looks up the sequence length and title of many accession numbers with a
+  single esummary request, which is far cheaper than fetching the records
+  themselves...
+
+  @param session (aiohttp.ClientSession): The session to send the request with
+  @param accessions (list): The accession numbers to summarize
+
+  @returns (dict): A mapping of accession number to a dict with its sequence
+    length as "slen" and its title as "title", missing any accessions which
+    could not be summarized
+  """
+  docsums, missing = _split_cached("docsum", accessions, json.loads)
+  if not missing:
+    return docsums
+
+  try:
+    text = await _eutils_request(session, "esummary.fcgi", {
+      "db": "nuccore",
+      "id": ",".join(missing),
+      "retmode": "json",
+    })
+    result = json.loads(text)["result"]
+    # docsums are keyed by uid, so match them back up by accession.version
+    for uid in result["uids"]:
+      docsum = {"slen": result[uid]["slen"], "title": result[uid]["title"]}
+      docsums[result[uid]["accessionversion"]] = docsum
+      _cache_record("docsum", result[uid]["accessionversion"], json.dumps(docsum))
+  except (*FETCH_ERRORS, KeyError):
+    print(f"Failed to summarize batch of {len(missing)} accessions...")
+  return docsums
+
+def _is_complete(docsum):
+  # titles end in "complete cds", "complete genome", "partial cds" and so on
+  return "partial" not in docsum["title"].lower() and docsum["slen"] >= MIN_RECORD_LENGTH
+
+def rank_accessions(ids, docsums):
+  """
+  Orders a species' search hits by which to try first, smallest complete record
+  up, so that a short COX3 record is fetched instead of a whole mitochondrial
+  genome whenever one exists...
+
+  @param ids (list): The accession numbers found for a species, in search order
+  @param docsums (dict): A mapping of accession number to its summary, as
+    returned by summarize_accessions
 
-def fetch_genbank(accession):
+  @returns (list): The complete records from smallest to largest, always ending
+    with the first hit as the last resort
+  """
+  candidates = [accession for accession in ids if accession in docsums and _is_complete(docsums[accession])]
+  ranked = sorted(candidates, key=lambda accession: docsums[accession]["slen"])
+  if ids[0] not in ranked:
+    ranked.append(ids[0])
+  return ranked
+
+async def fetch_genbank(session, accession):
   """
   Fetches the GenBank record for a given accession number
 
+  @param session (aiohttp.ClientSession): The session to send the request with
   @param accession (str): The accession number of the desired GenBank record
 
   @returns (SeqRecord): A Biopython SeqRecord object containing the GenBank data
   """
   seq_record = None
   try:
-    with Entrez.efetch(db="nuccore", id=accession, rettype="gb", retmode="text") as handle:
-      seq_record = SeqIO.read(handle, "gb")
-  except:
+    text = _cached_record("gb", accession)
+    if text is not None:
+      return SeqIO.read(io.StringIO(text), "gb")
+    text = await _eutils_request(session, "efetch.fcgi", {
+      "db": "nuccore",
+      "id": accession,
+      "rettype": "gb",
+      "retmode": "text",
+    })
+    seq_record = SeqIO.read(io.StringIO(text), "gb")
+    _cache_record("gb", accession, text)
+  except FETCH_ERRORS:
     print(f"Failed to fetch {accession}...")
   return seq_record
 
+async def fetch_genbank_many(session, accessions):
+  """
+  Fetches the GenBank records for many accession numbers in a single request,
+  skipping the network for any records which are already cached
+
+  @param session (aiohttp.ClientSession): The session to send the request with
+  @param accessions (list): The accession numbers of the desired GenBank records
+
+  @returns (dict): A mapping of accession number to Biopython SeqRecord, missing
+    any accessions which could not be fetched
+  """
+  seq_records, missing = _split_cached("gb", accessions, lambda text: SeqIO.read(io.StringIO(text), "gb"))
+  if not missing:
+    return seq_records
+
+  try:
+    text = await _eutils_request(session, "efetch.fcgi", {
+      "db": "nuccore",
+      "id": ",".join(missing),
+      "rettype": "gb",
+      "retmode": "text",
+    })
+    for record_text in _split_genbank(text):
+      seq_record = SeqIO.read(io.StringIO(record_text), "gb")
+      seq_records[seq_record.id] = seq_record
+      _cache_record("gb", seq_record.id, record_text)
+  except FETCH_ERRORS:
+    print(f"Failed to fetch batch of {len(missing)} accessions...")
+  return seq_records
+
+def _parse_cds_fasta(text):
+  """
+  Parses the protein translations out of a fasta_cds_aa efetch response...
+
+  @param text (str): The concatenated fasta text of one or more records
+
+  @returns (dict): A mapping of accession number to a mapping of gene name to
+    the translation of the first CDS for that gene
+  """
+  cds_translations = {}
+  for seq_record in SeqIO.parse(io.StringIO(text), "fasta"):
+    # ids look like lcl|NC_012920.1_prot_YP_003024032.1_11
+    accession = seq_record.id.split("|", 1)[-1].rsplit("_prot_", 1)[0]
+    genes = cds_translations.setdefault(accession, {})
+    match = re.search(r"\[gene=([^\]]+)\]", seq_record.description)
+    if match:
+      genes.setdefault(match.group(1), str(seq_record.seq))
+  return cds_translations
+
+async def post_accessions(session, accessions):
+  """
+  Uploads accession numbers to the NCBI history server, so that their records
+  can be fetched afterwards without sending the ids again...
+
+  @param session (aiohttp.ClientSession): The session to send the request with
+  @param accessions (list): The accession numbers to post
+
+  @returns (tuple): The WebEnv and query_key referring to the posted accessions
+  """
+  text = await _eutils_request(session, "epost.fcgi", {
+    "db": "nuccore",
+    "id": ",".join(accessions),
+  }, method="POST")
+  try:
+    result = ElementTree.fromstring(text)
+  except ElementTree.ParseError as e:
+    # ncbi sometimes answers with an html error page instead
+    raise ValueError(f"epost returned an unreadable response: {e}") from e
+  if result.find("ERROR") is not None:
+    raise ValueError(f"epost failed: {result.findtext('ERROR')}")
+  return result.findtext("WebEnv"), result.findtext("QueryKey")
+
+async def fetch_by_history(session, webenv, query_key, retstart=0, retmax=HISTORY_PAGE_SIZE):
+  """
+  Fetches one page of CDS protein translations for records on the history
+  server...
+
+  @param session (aiohttp.ClientSession): The session to send the request with
+  @param webenv (str): The WebEnv returned by the history server
+  @param query_key (str): The query_key of the posted records
+  @param retstart (int): Index of the first record to fetch (default is 0)
+  @param retmax (int): Maximum number of records to fetch (default is
+    HISTORY_PAGE_SIZE)
+
+  @returns (dict): A mapping of accession number to a mapping of gene name to
+    translation, for the records in this page which have CDS translations
+  """
+  text = await _eutils_request(session, "efetch.fcgi", {
+    "db": "nuccore",
+    "WebEnv": webenv,
+    "query_key": query_key,
+    "retstart": retstart,
+    "retmax": retmax,
+    "rettype": "fasta_cds_aa",
+    "retmode": "text",
+  })
+  return _parse_cds_fasta(text)
+
+async def fetch_cds_translations_many(session, accessions):
+  """
+  Fetches just the CDS protein translations for many accession numbers, which
+  are a fraction of the size of the full GenBank records; the accessions are
+  posted once and then fetched back from the history server in pages
+
+  @param session (aiohttp.ClientSession): The session to send the request with
+  @param accessions (list): The accession numbers of the desired records
+
+  @returns (dict): A mapping of accession number to a mapping of gene name to
+    translation, which is empty for records without any CDS translations and
+    missing any accessions which could not be fetched
+  """
+  cds_translations, missing = _split_cached("cds", accessions, json.loads)
+  if not missing:
+    return cds_translations
+
+  try:
+    webenv, query_key = await post_accessions(session, missing)
+    pages = [
+      fetch_by_history(session, webenv, query_key, retstart, HISTORY_PAGE_SIZE)
+      for retstart in range(0, len(missing), HISTORY_PAGE_SIZE)
+    ]
+    fetched = {}
+    for page in await asyncio.gather(*pages):
+      fetched.update(page)
+    for accession in missing:
+      genes = fetched.get(accession, {})
+      cds_translations[accession] = genes
+      _cache_record("cds", accession, json.dumps(genes))
+  except FETCH_ERRORS:
+    print(f"Failed to fetch CDS translations for {len(missing)} accessions...")
+  return cds_translations
+
+async def _fetch_in_batches(fetch_many, session, accessions):
+  # fetch_many is one of the *_many fetchers, which all return a dict per batch
+  fetches = [
+    fetch_many(session, accessions[i:i + FETCH_BATCH_SIZE])
+    for i in range(0, len(accessions), FETCH_BATCH_SIZE)
+  ]
+  results = {}
+  for batch in await asyncio.gather(*fetches):
+    results.update(batch)
+  return results
+
+def translations_from_record(seq_record, gene_names):
+  """
+  Grabs the translations of several genes from a GenBank SeqRecord in a single
+  pass over its features, checking each CDS against a set of the wanted genes
+  so the cost does not grow with how many genes are asked for...
+
+  @param seq_record (SeqRecord): A Biopython SeqRecord object containing the
+    GenBank data
+  @param gene_names (iterable): The genes to grab the translations of
+
+  @returns (dict): A mapping of gene name to the translation of the first CDS
+    for that gene, missing any genes which were not found
+  """
+  wanted = set(gene_names)
+  translations = {}
+  for feature in seq_record.features:
+    if feature.type != "CDS":
+      continue
+    for gene_name in wanted.intersection(feature.qualifiers.get("gene", ())):
+      translations[gene_name] = feature.qualifiers.get("translation", ["<No translation available>"])[0]
+    wanted.difference_update(translations)
+    if not wanted:
+      break
+  return translations
+
 def cox3_translation_from_record(seq_record):
   """
   Grabs the translation of the COX3 gene from a GenBank SeqRecord, or None if
@@ -55,219 +515,225 @@ def cox3_translation_from_record(seq_record):
   @returns (str|None): The amino acid sequence of the COX3 gene translation, or
     None if not found
   """
-  for feature in seq_record.features:
-    if feature.type == "CDS" and "gene" in feature.qualifiers:
-      if "COX3" in feature.qualifiers["gene"]:
-        return feature.qualifiers.get("translation", ["<No translation available>"])[0]
-  return None
+  return translations_from_record(seq_record, ["COX3"]).get("COX3")
+
+async def _fetch_translations(session, accessions, gene_name):
+  """
+  Fetches the translation of one gene out of many records, using just their CDS
+  translations off the history server and falling back to the full GenBank
+  record when no CDS translations come back...
+
+  @param session (aiohttp.ClientSession): The session to send requests with
+  @param accessions (list): The accession numbers of the records
+  @param gene_name (str): The gene to grab the translation of
+
+  @returns (dict): A mapping of accession number to the gene's translation, or
+    None if the record has no such gene or could not be fetched
+  """
+  # species often share a record, which only needs fetching once
+  accessions = list(dict.fromkeys(accessions))
+  cds_translations = await fetch_cds_translations_many(session, accessions)
+  fetched = {
+    accession: cds_translations[accession].get(gene_name)
+    for accession in accessions if cds_translations.get(accession)
+  }
+
+  fallback = [accession for accession in accessions if accession not in fetched]
+  records = await _fetch_in_batches(fetch_genbank_many, session, fallback)
+  for accession in fallback:
+    record = records.get(accession)
+    if record is None:
+      print(f"Failed to fetch {accession}...")
+      fetched[accession] = None
+    else:
+      fetched[accession] = translations_from_record(record, [gene_name]).get(gene_name)
+  return fetched
+
+async def extract_cox3_many(session, species_names, on_translation=None):
+  """
+  Grabs the translations of the COX3 gene for many species, searching for each
+  species first, summarizing the hits to rank the records of each smallest
+  first, and then fetching their CDS translations in batches, trying the next
+  record of any species whose record had no COX3 translation...
+
+  @param session (aiohttp.ClientSession): The session to send requests with
+  @param species_names (list): Latin species names to grab the COX3 gene
+    sequences of
+  @param on_translation (callable|None): Called with the species name and its
+    COX3 sequence as soon as each one is found (default is None)
+
+  @returns (dict): A mapping of species name to its COX3 sequence, or None if
+    not found
+  """
+  gene_name = "COX3"
+  # repeated species are only searched once, and share their translation
+  species_names = list(dict.fromkeys(species_names))
+  translations = {species_name: None for species_name in species_names}
+
+  def found(species_name, translation):
+    translations[species_name] = translation
+    if translation is not None and on_translation is not None:
+      on_translation(species_name, translation)
 
-def extract_cox3(species_name):
+  # first pass, find the candidate accession ids for each species
+  searches = [search_species_sequences(session, species_name, gene_name) for species_name in species_names]
+  search_ids = {}
+  for species_name, ids in zip(species_names, await asyncio.gather(*searches)):
+    if not ids or len(ids) < 1:
+      print(f"No {gene_name} gene sequences found for {species_name}.")
+    else:
+      search_ids[species_name] = ids
+
+  # then summarize every candidate to rank each species' records, smallest first
+  candidates = list(dict.fromkeys(accession for ids in search_ids.values() for accession in ids))
+  docsums = await _fetch_in_batches(summarize_accessions, session, candidates)
+  ranked = {species_name: rank_accessions(ids, docsums) for species_name, ids in search_ids.items()}
+
+  # second pass, fetch each species' best record, moving on to its next one
+  # whenever a record turns out to have no COX3 translation
+  while ranked:
+    accession_ids = {species_name: accessions.pop(0) for species_name, accessions in ranked.items()}
+    fetched = await _fetch_translations(session, list(accession_ids.values()), gene_name)
+    for species_name, accession_id in accession_ids.items():
+      if fetched.get(accession_id) is not None:
+        found(species_name, fetched[accession_id])
+    ranked = {
+      species_name: accessions for species_name, accessions in ranked.items()
+      if accessions and translations[species_name] is None
+    }
+  return translations
+
+async def extract_cox3(session, species_name):
   """
   Grabs the translation of the COX3 gene given some species name...
 
+  @param session (aiohttp.ClientSession): The session to send requests with
   @param species_name (str): A latin species name to grab the COX3 gene sequence of
 
   @returns (str|None): The COX3 sequence for the provided species, or None if not
     found
   """
-  gene_name = "COX3"
-  accession_ids = search_species_sequences(species_name, gene_name)
+  return (await extract_cox3_many(session, [species_name]))[species_name]
 
-  if not accession_ids or len(accession_ids) < 1:
-    print(f"No {gene_name} gene sequences found for {species_name}.")
-  else:
-    accession_id = accession_ids[0]
-    record = fetch_genbank(accession_id)
-    if record is None:
-      return None
-    cox3_translation = cox3_translation_from_record(record)
-    if cox3_translation is None:
-      return None
-    return cox3_translation
+async def run(species_names, on_translation=None):
+  """
+  Grabs the translations of the COX3 gene for many species, sharing one pooled
+  HTTP session between all of the requests...
 
-if __name__ == "__main__":
-  species_list = [
-    "Gorilla beringei",
-    "Pan troglodytes",
-    "Pongo pygmaeus",
-    "Homo sapiens",
-    "Lemur catta",
-    "Panthera leo",
-    "Panthera tigris",
-    "Ursus arctos",
-    "Canis lupus",
-    "Felis catus",
-    "Balaenoptera musculus",
-    "Delphinus delphis",
-    "Physeter macrocephalus",
-    "Orcinus orca",
-    "Tursiops truncatus",
-    "Pteropus vampyrus",
-    "Desmodus rotundus",
-    "Myotis lucifugus",
-    "Eonycteris spelaea",
-    "Rhinolophus ferrumequinum",
-    "Castor canadensis",
-    "Hydrochoerus hydrochaeris",
-    "Sciurus vulgaris",
-    "Rattus norvegicus",
-    "Cavia porcellus",
-    "Equus ferus caballus",
-    "Rhinoceros unicornis",
-    "Tapirus terrestris",
-    "Diceros bicornis",
-    "Equus zebra",
-    "Loxodonta africana",
-    "Elephas maximus",
-    "Trichechus manatus",
-    "Dugong dugon",
-    "Procavia capensis",
-    "Orycteropus afer",
-    "Dasypus novemcinctus",
-    "Bradypus tridactylus",
-    "Choloepus didactylus",
-    "Myrmecophaga tridactyla",
-    "Ornithorhynchus anatinus",
-    "Tachyglossus aculeatus",
-    "Macropus rufus",
-    "Phascolarctos cinereus",
-    "Vombatus ursinus",
-    "Dendrolagus goodfellowi",
-    "Sarcophilus harrisii",
-    "Didelphis virginiana",
-    "Monodelphis domestica",
-    "Phascolosorex dorsalis",
-    "Thylacinus cynocephalus",
-    "Acinonyx jubatus",
-    "Lynx lynx",
-    "Puma concolor",
-    "Leopardus pardalis",
-    "Panthera onca",
-    "Panthera uncia",
-    "Mustela putorius furo",
-    "Mephitis mephitis",
-    "Procyon lotor",
-    "Ailurus fulgens",
-    "Enhydra lutris",
-    "Odobenus rosmarus",
-    "Mirounga leonina",
-    "Halichoerus grypus",
-    "Phoca vitulina",
-    "Erinaceus europaeus",
-    "Atelerix albiventris",
-    "Sorex araneus",
-    "Talpa europaea",
-    "Condylura cristata",
-    "Elephantulus rufescens",
-    "Macroscelides proboscideus",
-    "Solenodon paradoxus",
-    "Tenrec ecaudatus",
-    "Echinops telfairi",
-    "Oryctolagus cuniculus",
-    "Lepus europaeus",
-    "Sylvilagus floridanus",
-    "Ochotona princeps",
-    "Camelus dromedarius",
-    "Camelus bactrianus",
-    "Vicugna vicugna",
-    "Lama glama",
-    "Bos taurus",
-    "Bison bison",
-    "Ovis aries",
-    "Capra hircus",
-    "Antilope cervicapra",
-    "Gazella gazella",
-    "Oryx dammah",
-    "Alces alces",
-    "Cervus elaphus",
-    "Dama dama",
-    "Giraffa camelopardalis",
-    "Okapia johnstoni",
-    "Hippopotamus amphibius",
-    "Sus scrofa",
-    "Phacochoerus africanus",
-    "Dicotyles tajacu",
-    "Bubalus bubalis",
-    "Syncerus caffer",
-    "Tragelaphus strepsiceros",
-    "Taurotragus oryx",
-    "Connochaetes taurinus",
-    "Pantholops hodgsonii",
-    "Rangifer tarandus",
-    "Moschus moschiferus",
-    "Capreolus capreolus",
-    "Hydropotes inermis",
-    "Neotragus pygmaeus",
-    "Hippocamelus bisulcus",
-    "Pudu puda",
-    "Mazama americana",
-    "Odocoileus virginianus",
-    "Blastocerus dichotomus",
-    "Ozotoceros bezoarticus",
-    "Antilocapra americana",
-    "Saiga tatarica",
-    "Vicugna pacos",
-    "Chinchilla lanigera",
-    "Lagidium viscacia",
-    "Erethizon dorsatum",
-    "Coendou prehensilis",
-    "Hydrochoerus isthmius",
-    "Dasyprocta punctata",
-    "Myocastor coypus",
-    "Octodon degus",
-    "Thryonomys swinderianus",
-    "Petromus typicus",
-    "Georychus capensis",
-    "Heterocephalus glaber",
-    "Spalax ehrenbergi",
-    "Rattus rattus",
-    "Mus musculus",
-    "Peromyscus maniculatus",
-    "Apodemus sylvaticus",
-    "Clethrionomys glareolus",
-    "Microtus arvalis",
-    "Ondatra zibethicus",
-    "Arvicola amphibius",
-    "Lemmus lemmus",
-    "Dicrostonyx torquatus",
-    "Neofiber alleni",
-    "Castor fiber",
-    "Castor canadensis",
-    "Hydromys chrysogaster",
-    "Platypus australis",
-    "Zaglossus bruijni",
-    "Echidna hystrix",
-    "Didelphis marsupialis",
-    "Philander opossum",
-    "Caluromys philander",
-    "Monodelphis brevicaudata",
-    "Thylamys elegans",
-    "Dasyurus viverrinus",
-    "Sminthopsis crassicaudata",
-    "Antechinus stuartii",
-    "Perameles nasuta",
-    "Macrotis lagotis",
-    "Notoryctes typhlops",
-    "Vombatus hirsutus",
-    "Lasiorhinus latifrons",
-    "Phascolarctos cinereus",
-    "Pseudocheirus peregrinus",
-    "Petaurus breviceps",
-    "Bettongia penicillata",
-    "Aepyprymnus rufescens",
-    "Dendrolagus matschiei",
-    "Macropus giganteus",
-    "Wallabia bicolor",
-  ]
+  @param species_names (list): Latin species names to grab the COX3 gene
+    sequences of
+  @param on_translation (callable|None): Called with the species name and its
+    COX3 sequence as soon as each one is found (default is None)
 
-  # sequentially process each species to extract COX3 translation
-  translations = {}
+  @returns (dict): A mapping of species name to its COX3 sequence, or None if
+    not found
+  """
+  async with make_session() as session:
+    return await extract_cox3_many(session, species_names, on_translation)
+
+class TranslationWriter:
+  """
+  Streams translations out to a JSON object file one entry per line as they are
+  found, so an interrupted run still leaves everything found so far on disk...
+
+  The finished file is the same as json.dump(translations, indent=4) would
+  write for a flat mapping of species name to sequence.
+  """
+
+  def __init__(self, path):
+    """
+    @param path (str): The path of the JSON file to write
+    """
+    self.path = path
+    self.count = 0
+    self._file = None
+
+  def __enter__(self):
+    self._file = open(self.path, "w")
+    self._file.write("{")
+    return self
 
-  for species in species_list:
-    print(f"Fetching COX3 translation for {species}...")
-    translation = extract_cox3(species)
-    translations[species] = translation
+  def __exit__(self, *exc_info):
+    self._file.write("\n}" if self.count else "}")
+    self._file.close()
 
+  def write(self, species_name, translation):
+    """
+    Appends one species and its translation to the file...
+
+    @param species_name (str): The species the translation belongs to
+    @param translation (str): The amino acid sequence of the translation
+    """
+    separator = "," if self.count else ""
+    self._file.write(f"{separator}\n    {json.dumps(species_name)}: {json.dumps(translation)}")
+    self._file.flush()
+    self.count += 1
+
+def load_species(path):
+  """
+  Reads the species to search for out of a text file with one latin species
+  name per line, skipping blank lines...
+
+  @param path (str): The path of the species file
+
+  @returns (list): The species names in file order
+  """
+  with open(path) as f:
+    return [line.strip() for line in f.read().splitlines() if line.strip()]
+
+def load_translations(path):
+  """
+  Reads the translations written by an earlier run, so that they can be kept
+  and their species skipped...
+
+  @param path (str): The path of the JSON file written by TranslationWriter
+
+  @returns (dict): A mapping of species name to its COX3 sequence, which is
+    empty when the file does not exist
+
+  @raises ValueError: If the file exists but cannot be read as translations
+  """
+  try:
+    with open(path) as f:
+      text = f.read()
+  except FileNotFoundError:
+    return {}
+  # an interrupted run leaves off the closing brace, but every entry before it
+  # was written out whole
+  for candidate in (text, text + "\n}"):
+    try:
+      return json.loads(candidate)
+    except json.JSONDecodeError:
+      pass
+  raise ValueError(f"{path} is not a translations file")
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Pull COX3 translations for a list of species from NCBI")
+  parser.add_argument("--input", default="species.txt", help="file with one species name per line")
+  parser.add_argument("--output", default="cox3_translations.json", help="JSON file to write translations to")
+  parser.add_argument("--resume", action="store_true", help="keep translations already in --output and skip their species")
+  args = parser.parse_args(argv)
+
+  species_list = load_species(args.input)
+  previous = {}
+  if args.resume:
+    # bail out rather than let the writer overwrite translations we could not read
+    try:
+      previous = load_translations(args.output)
+    except ValueError as e:
+      parser.error(f"cannot resume: {e}")
+  species_list = [species for species in species_list if species not in previous]
+
+  # search every species concurrently, then fetch all of their records in batches,
+  # writing each translation out as soon as it is found; the output is rewritten
+  # from scratch, so resumed translations are written back first
+  with TranslationWriter(args.output) as writer:
+    for species, translation in previous.items():
+      writer.write(species, translation)
+    translations = asyncio.run(run(species_list, writer.write))
+
+  if previous:
+    print(f"\nResumed {len(previous)} translations from {args.output}")
   print("\n=== Summary of COX3 Translations ===")
   for species, translation in translations.items():
     if translation:
@@ -275,7 +741,5 @@ if __name__ == "__main__":
     else:
       print(f"[✗] {species}: Translation not found")
 
-  filtered_translations = {species: seq for species, seq in translations.items() if seq is not None}
-  json_output = json.dumps(filtered_translations, indent=4)
-  with open("cox3_translations.json", "w") as json_file:
-    json_file.write(json_output)
\ No newline at end of file
+if __name__ == "__main__":
+  main()
@@ -1,16 +1,52 @@
 # totally unnecessary tests but i wanna test out magicmock
+from Bio import SeqIO
+from Bio.Seq import Seq
 from Bio.SeqFeature import SeqFeature, FeatureLocation
+from Bio.SeqRecord import SeqRecord
 
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock, PropertyMock
 
+import aiohttp
 import pytest
 
+import asyncio
+import contextlib
+import io
+import json
+import time
+
 from pull.core import (
   search_species_sequences,
   fetch_genbank,
+  fetch_genbank_many,
+  summarize_accessions,
+  rank_accessions,
+  fetch_cds_translations_many,
+  post_accessions,
   cox3_translation_from_record,
+  translations_from_record,
   extract_cox3,
+  extract_cox3_many,
+  make_session,
+  open_cache,
+  TranslationWriter,
+  load_species,
+  load_translations,
+  main,
+  _wait_for_rate_limit,
+  _eutils_request,
+  MAX_REQUESTS,
+  MAX_ATTEMPTS,
+  MAX_RETRY_DELAY,
 )
+import pull.core
+
+
+# keep every test away from the on disk cache
+@pytest.fixture(autouse=True)
+def memory_cache():
+  with patch("pull.core._cache", open_cache(":memory:")) as cache:
+    yield cache
 
 # mock
 class FakeSeqRecord:
@@ -28,65 +64,504 @@ def make_feature(gene_name="COX3", translation="MKT..."):
     },
   )
 
+# helper for constructing genbank flat file text
+def make_genbank(accession):
+  record = SeqRecord(Seq("ACGT"), id=accession, name=accession.split(".")[0])
+  record.annotations["molecule_type"] = "DNA"
+  out = io.StringIO()
+  SeqIO.write(record, out, "gb")
+  return out.getvalue()
+
 def test_cox3_translation_from_record_found():
   record = FakeSeqRecord(features=[make_feature()])
   assert cox3_translation_from_record(record) == "MKT..."
 
+def test_cox3_translation_from_record_first_match():
+  other = make_feature("COX2", "MAH...")
+  untagged = SeqFeature(type="CDS", location=FeatureLocation(0, 10), qualifiers={})
+  record = FakeSeqRecord(features=[other, untagged, make_feature("COX3", "MTH..."), make_feature("COX3", "MZZ...")])
+  assert cox3_translation_from_record(record) == "MTH..."
+
+def test_translations_from_record_many_genes():
+  features = [make_feature("COX1", "MFI..."), make_feature("COX3", "MTH..."), make_feature("COX1", "MZZ...")]
+  record = FakeSeqRecord(features=features)
+  result = translations_from_record(record, ["COX1", "COX3", "ND1"])
+  assert result == {"COX1": "MFI...", "COX3": "MTH..."}
+
 def test_cox3_translation_from_record_not_found():
   record = FakeSeqRecord(features=[])
   assert cox3_translation_from_record(record) is None
 
-@patch("pull.core.Entrez.esearch")
-@patch("pull.core.Entrez.read")
-def test_search_species_sequences(mock_read, mock_esearch):
-  mock_read.return_value = {"IdList": ["ABC123", "XYZ789"]}
-  mock_esearch.return_value = MagicMock()
-  result = search_species_sequences("Homo sapiens", "COX3", 2)
+def test_make_session_pools_connections():
+  async def check():
+    async with make_session() as session:
+      assert session.connector.limit == MAX_REQUESTS
+  asyncio.run(check())
+
+@patch("pull.core._next_request_at", 0.0)
+@patch("pull.core.time.monotonic", return_value=100.0)
+@patch("pull.core.asyncio.sleep")
+def test_wait_for_rate_limit_spaces_requests(mock_sleep, mock_monotonic):
+  async def burst():
+    await asyncio.gather(*[_wait_for_rate_limit() for _ in range(3)])
+  asyncio.run(burst())
+  delays = [call.args[0] for call in mock_sleep.call_args_list]
+  assert delays == pytest.approx([0, 1 / MAX_REQUESTS, 2 / MAX_REQUESTS])
+
+# fake session which, like a pooled connector, only lets limit requests hold a
+# connection at once and records when each one actually goes out
+class FakePooledSession:
+  def __init__(self, latencies, limit):
+    self.latencies = iter(latencies)
+    self.pool = asyncio.Semaphore(limit)
+    self.sent = []
+
+  @contextlib.asynccontextmanager
+  async def request(self, method, url, **kwargs):
+    async with self.pool:
+      self.sent.append(time.monotonic())
+      await asyncio.sleep(next(self.latencies))
+      response = MagicMock(status=200)
+      response.text = AsyncMock(return_value="ok")
+      yield response
+
+@patch("pull.core.MAX_REQUESTS", 8)
+@patch("pull.core._next_request_at", 0.0)
+@patch("pull.core._request_slots", None)
+def test_eutils_request_spaces_actual_sends():
+  async def burst():
+    # the first requests all hold their connection until 1.3s, by which time the
+    # send times of the next few have already come due
+    latencies = [1.3 - i / 8 for i in range(8)] + [0.01] * 8
+    session = FakePooledSession(latencies, limit=8)
+    await asyncio.gather(*[_eutils_request(session, "esearch.fcgi", {}) for _ in range(16)])
+    return sorted(session.sent)
+  sent = asyncio.run(burst())
+  gaps = [later - earlier for earlier, later in zip(sent, sent[1:])]
+  assert min(gaps) >= 1 / 8 - 0.02
+
+# helper for constructing a session whose requests all respond with text
+def make_session_mock(text):
+  session = MagicMock()
+  response = session.request.return_value.__aenter__.return_value
+  response.raise_for_status = MagicMock()
+  response.text = AsyncMock(return_value=text)
+  return session
+
+@patch("pull.core._wait_for_rate_limit")
+def test_eutils_request_get(mock_wait):
+  session = make_session_mock("ok")
+  result = asyncio.run(_eutils_request(session, "esearch.fcgi", {"db": "nucleotide"}))
+  assert result == "ok"
+  method, url = session.request.call_args.args
+  assert method == "GET" and url.endswith("esearch.fcgi")
+  assert session.request.call_args.kwargs["params"]["db"] == "nucleotide"
+  mock_wait.assert_called_once()
+
+@patch("pull.core._wait_for_rate_limit")
+def test_eutils_request_post(mock_wait):
+  session = make_session_mock("ok")
+  asyncio.run(_eutils_request(session, "epost.fcgi", {"db": "nuccore"}, method="POST"))
+  assert session.request.call_args.args[0] == "POST"
+  assert session.request.call_args.kwargs["data"]["db"] == "nuccore"
+
+# helper for constructing a session which responds with each status in turn
+def make_status_session_mock(statuses, text="ok", headers=None):
+  session = make_session_mock(text)
+  response = session.request.return_value.__aenter__.return_value
+  response.headers = headers or {}
+  type(response).status = PropertyMock(side_effect=statuses)
+  return session
+
+@patch("pull.core.asyncio.sleep")
+@patch("pull.core._wait_for_rate_limit")
+def test_eutils_request_retries(mock_wait, mock_sleep):
+  session = make_status_session_mock([429, 503, 200], headers={"Retry-After": "2"})
+  result = asyncio.run(_eutils_request(session, "esearch.fcgi", {}))
+  assert result == "ok"
+  assert session.request.call_count == 3
+  assert mock_sleep.call_args_list[0].args[0] == 2.0
+
+@patch("pull.core._next_request_at", 0.0)
+@patch("pull.core.time.monotonic", return_value=100.0)
+@patch("pull.core.asyncio.sleep")
+@patch("pull.core._wait_for_rate_limit")
+def test_eutils_request_caps_retry_after(mock_wait, mock_sleep, mock_monotonic):
+  session = make_status_session_mock([429, 200], headers={"Retry-After": "3600"})
+  asyncio.run(_eutils_request(session, "esearch.fcgi", {}))
+  assert mock_sleep.call_args_list[0].args[0] == MAX_RETRY_DELAY
+  # every other request is held back by the 429 as well
+  assert pull.core._next_request_at == 100.0 + MAX_RETRY_DELAY
+
+@patch("pull.core.asyncio.sleep")
+@patch("pull.core._wait_for_rate_limit")
+def test_eutils_request_retries_exhausted(mock_wait, mock_sleep):
+  session = make_status_session_mock([503] * MAX_ATTEMPTS)
+  response = session.request.return_value.__aenter__.return_value
+  response.raise_for_status.side_effect = aiohttp.ClientError("503")
+  with pytest.raises(aiohttp.ClientError):
+    asyncio.run(_eutils_request(session, "esearch.fcgi", {}))
+  assert session.request.call_count == MAX_ATTEMPTS
+
+@patch("pull.core.asyncio.sleep")
+@patch("pull.core._wait_for_rate_limit")
+def test_eutils_request_no_retry_on_client_error(mock_wait, mock_sleep):
+  session = make_status_session_mock([400])
+  response = session.request.return_value.__aenter__.return_value
+  response.raise_for_status.side_effect = aiohttp.ClientError("400")
+  with pytest.raises(aiohttp.ClientError):
+    asyncio.run(_eutils_request(session, "esearch.fcgi", {}))
+  assert session.request.call_count == 1
+
+@patch("pull.core._eutils_request", side_effect=aiohttp.ClientError("Fail"))
+def test_search_species_sequences_failure_not_cached(mock_get):
+  assert asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens")) == []
+  mock_get.side_effect = None
+  mock_get.return_value = json.dumps({"esearchresult": {"idlist": ["ABC123"]}})
+  assert asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens")) == ["ABC123"]
+
+@patch("pull.core._eutils_request")
+def test_search_species_sequences(mock_get):
+  mock_get.return_value = json.dumps({"esearchresult": {"idlist": ["ABC123", "XYZ789"]}})
+  result = asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens", "COX3", 2))
   assert result == ["ABC123", "XYZ789"]
-  mock_esearch.assert_called_once()
+  mock_get.assert_called_once()
+  assert mock_get.call_args.args[2]["retmode"] == "json"
 
 @patch("pull.core.SeqIO.read")
-@patch("pull.core.Entrez.efetch")
-def test_fetch_genbank_success(mock_efetch, mock_read):
-  mock_handle = MagicMock()
-  mock_efetch.return_value.__enter__.return_value = mock_handle
+@patch("pull.core._eutils_request")
+def test_fetch_genbank_success(mock_get, mock_read):
+  mock_get.return_value = "LOCUS ..."
   mock_read.return_value = "FakeSeqRecord"
-  result = fetch_genbank("ABC123")
+  result = asyncio.run(fetch_genbank(MagicMock(), "ABC123"))
   assert result == "FakeSeqRecord"
 
-@patch("pull.core.SeqIO.read", side_effect=Exception("Fail"))
-@patch("pull.core.Entrez.efetch")
-def test_fetch_genbank_failure(mock_efetch, mock_read):
-  mock_handle = MagicMock()
-  mock_efetch.return_value.__enter__.return_value = mock_handle
-  result = fetch_genbank("BADID")
+@patch("pull.core._eutils_request")
+def test_search_species_sequences_error_json(mock_get):
+  mock_get.return_value = json.dumps({"esearchresult": {"ERROR": "Invalid query"}})
+  assert asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens")) == []
+  mock_get.return_value = json.dumps({"esearchresult": {"idlist": ["ABC123"]}})
+  assert asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens")) == ["ABC123"]
+
+@patch("pull.core.SeqIO.read", side_effect=ValueError("Fail"))
+@patch("pull.core._eutils_request")
+def test_fetch_genbank_failure(mock_get, mock_read):
+  mock_get.return_value = "LOCUS ..."
+  result = asyncio.run(fetch_genbank(MagicMock(), "BADID"))
   assert result is None
 
-@patch("pull.core.fetch_genbank")
+@patch("pull.core._eutils_request")
+def test_search_species_sequences_cached(mock_get):
+  mock_get.return_value = json.dumps({"esearchresult": {"idlist": ["ABC123"]}})
+  first = asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens"))
+  second = asyncio.run(search_species_sequences(MagicMock(), "Homo sapiens"))
+  assert first == second == ["ABC123"]
+  mock_get.assert_called_once()
+
+@patch("pull.core._eutils_request")
+def test_fetch_genbank_many_success(mock_get):
+  mock_get.return_value = make_genbank("ABC123.1") + make_genbank("XYZ789.1")
+  result = asyncio.run(fetch_genbank_many(MagicMock(), ["ABC123.1", "XYZ789.1"]))
+  assert sorted(result) == ["ABC123.1", "XYZ789.1"]
+  assert mock_get.call_args.args[2]["id"] == "ABC123.1,XYZ789.1"
+
+@patch("pull.core._eutils_request")
+def test_fetch_genbank_many_cached(mock_get):
+  mock_get.return_value = make_genbank("ABC123.1")
+  asyncio.run(fetch_genbank_many(MagicMock(), ["ABC123.1"]))
+  mock_get.return_value = make_genbank("XYZ789.1")
+  result = asyncio.run(fetch_genbank_many(MagicMock(), ["ABC123.1", "XYZ789.1"]))
+  assert sorted(result) == ["ABC123.1", "XYZ789.1"]
+  assert mock_get.call_count == 2
+  assert mock_get.call_args.args[2]["id"] == "XYZ789.1"
+
+ESUMMARY_JSON = json.dumps({"result": {
+  "uids": ["1", "2"],
+  "1": {"uid": "1", "accessionversion": "ABC123.1", "slen": 16569, "title": "Homo sapiens mitochondrion, complete genome"},
+  "2": {"uid": "2", "accessionversion": "XYZ789.1", "slen": 784, "title": "Homo sapiens COX3 gene, complete cds"},
+}})
+
+# helper for constructing esummary docsums
+def make_docsum(slen, title="COX3 gene, complete cds"):
+  return {"slen": slen, "title": title}
+
+@patch("pull.core._eutils_request")
+def test_summarize_accessions(mock_request):
+  mock_request.return_value = ESUMMARY_JSON
+  result = asyncio.run(summarize_accessions(MagicMock(), ["ABC123.1", "XYZ789.1"]))
+  assert result == {
+    "ABC123.1": make_docsum(16569, "Homo sapiens mitochondrion, complete genome"),
+    "XYZ789.1": make_docsum(784, "Homo sapiens COX3 gene, complete cds"),
+  }
+  cached = asyncio.run(summarize_accessions(MagicMock(), ["ABC123.1", "XYZ789.1"]))
+  assert cached == result
+  mock_request.assert_called_once()
+
+def test_rank_accessions():
+  docsums = {"GENOME.1": make_docsum(16569), "MRNA.1": make_docsum(1200), "SHORT.1": make_docsum(300)}
+  assert rank_accessions(["GENOME.1", "SHORT.1", "MRNA.1"], docsums) == ["MRNA.1", "GENOME.1"]
+  assert rank_accessions(["SHORT.1", "UNKNOWN.1"], docsums) == ["SHORT.1"]
+
+def test_rank_accessions_ends_with_first_hit():
+  docsums = {"GENOME.1": make_docsum(16569, "mitochondrion, complete genome"), "CDS.1": make_docsum(784)}
+  assert rank_accessions(["PARTIAL.1", "GENOME.1", "CDS.1"], docsums) == ["CDS.1", "GENOME.1", "PARTIAL.1"]
+
+def test_rank_accessions_skips_partial_cds():
+  docsums = {
+    "GENOME.1": make_docsum(16569, "mitochondrion, complete genome"),
+    "CDS.1": make_docsum(784),
+    "PARTIAL.1": make_docsum(600, "COX3 gene, partial cds"),
+    "LONGPARTIAL.1": make_docsum(750, "COX3 gene, partial cds"),
+  }
+  assert rank_accessions(["GENOME.1", "PARTIAL.1", "LONGPARTIAL.1", "CDS.1"], docsums)[0] == "CDS.1"
+  assert rank_accessions(["GENOME.1", "PARTIAL.1"], docsums) == ["GENOME.1"]
+
+def test_rank_accessions_keeps_complete_cds():
+  docsums = {"COX3CDS.1": make_docsum(784), "GENOME.1": make_docsum(16569)}
+  assert rank_accessions(["COX3CDS.1", "GENOME.1"], docsums) == ["COX3CDS.1", "GENOME.1"]
+  assert rank_accessions(["GENOME.1", "COX3CDS.1"], docsums) == ["COX3CDS.1", "GENOME.1"]
+
+@patch("pull.core.SeqIO.read", side_effect=ValueError("Fail"))
+@patch("pull.core._eutils_request")
+def test_fetch_genbank_many_failure(mock_get, mock_read):
+  mock_get.return_value = "LOCUS ..."
+  result = asyncio.run(fetch_genbank_many(MagicMock(), ["BADID"]))
+  assert result == {}
+
+CDS_FASTA = """>lcl|ABC123.1_prot_YP_1.1_1 [gene=COX2] [protein=cytochrome c oxidase subunit II]
+MAH...
+>lcl|ABC123.1_prot_YP_2.1_2 [gene=COX3] [protein=cytochrome c oxidase subunit III]
+MTH...
+>lcl|XYZ789.1_prot_3 [protein=hypothetical protein]
+MQQ...
+"""
+
+EPOST_XML = """<?xml version="1.0" encoding="UTF-8" ?>
+<ePostResult>
+  <QueryKey>1</QueryKey>
+  <WebEnv>MCID_123</WebEnv>
+</ePostResult>
+"""
+
+@patch("pull.core._eutils_request")
+def test_post_accessions(mock_request):
+  mock_request.return_value = EPOST_XML
+  result = asyncio.run(post_accessions(MagicMock(), ["ABC123.1", "XYZ789.1"]))
+  assert result == ("MCID_123", "1")
+  assert mock_request.call_args.kwargs["method"] == "POST"
+
+@patch("pull.core._eutils_request")
+def test_post_accessions_error(mock_request):
+  mock_request.return_value = "<ePostResult><ERROR>Empty id list</ERROR></ePostResult>"
+  with pytest.raises(ValueError):
+    asyncio.run(post_accessions(MagicMock(), []))
+
+@patch("pull.core._eutils_request")
+def test_post_accessions_not_xml(mock_request):
+  mock_request.return_value = "<html><body>Service unavailable"
+  with pytest.raises(ValueError):
+    asyncio.run(post_accessions(MagicMock(), ["ABC123.1"]))
+
+@patch("pull.core._eutils_request", return_value="<html><body>Service unavailable")
+def test_fetch_cds_translations_many_epost_not_xml(mock_request):
+  result = asyncio.run(fetch_cds_translations_many(MagicMock(), ["ABC123.1"]))
+  assert result == {}
+
+@patch("pull.core._eutils_request")
+def test_fetch_cds_translations_many_success(mock_request):
+  mock_request.side_effect = [EPOST_XML, CDS_FASTA]
+  result = asyncio.run(fetch_cds_translations_many(MagicMock(), ["ABC123.1", "XYZ789.1", "NOCDS.1"]))
+  assert result == {
+    "ABC123.1": {"COX2": "MAH...", "COX3": "MTH..."},
+    "XYZ789.1": {},
+    "NOCDS.1": {},
+  }
+  params = mock_request.call_args.args[2]
+  assert params["rettype"] == "fasta_cds_aa"
+  assert (params["WebEnv"], params["query_key"]) == ("MCID_123", "1")
+
+@patch("pull.core._eutils_request")
+def test_fetch_cds_translations_many_cached(mock_request):
+  mock_request.side_effect = [EPOST_XML, CDS_FASTA]
+  asyncio.run(fetch_cds_translations_many(MagicMock(), ["ABC123.1"]))
+  result = asyncio.run(fetch_cds_translations_many(MagicMock(), ["ABC123.1"]))
+  assert result["ABC123.1"]["COX3"] == "MTH..."
+  assert mock_request.call_count == 2
+
+@patch("pull.core._eutils_request", side_effect=aiohttp.ClientError("Fail"))
+def test_fetch_cds_translations_many_failure(mock_get):
+  result = asyncio.run(fetch_cds_translations_many(MagicMock(), ["BADID"]))
+  assert result == {}
+
+@patch("pull.core.summarize_accessions", return_value={})
+@patch("pull.core.fetch_genbank_many")
+@patch("pull.core.fetch_cds_translations_many")
 @patch("pull.core.search_species_sequences")
-def test_extract_cox3_success(mock_search, mock_fetch):
-  record = FakeSeqRecord(features=[make_feature("COX3", "MKT...")])
+def test_extract_cox3_success(mock_search, mock_cds, mock_fetch, mock_summary):
   mock_search.return_value = ["ABC123"]
-  mock_fetch.return_value = record
-  result = extract_cox3("Homo sapiens")
+  mock_cds.return_value = {"ABC123": {"COX3": "MKT..."}}
+  mock_fetch.return_value = {}
+  result = asyncio.run(extract_cox3(MagicMock(), "Homo sapiens"))
+  assert result == "MKT..."
+  mock_fetch.assert_not_called()
+
+@patch("pull.core.summarize_accessions", return_value={})
+@patch("pull.core.fetch_genbank_many")
+@patch("pull.core.fetch_cds_translations_many", return_value={"ABC123": {}})
+@patch("pull.core.search_species_sequences", return_value=["ABC123"])
+def test_extract_cox3_genbank_fallback(mock_search, mock_cds, mock_fetch, mock_summary):
+  record = FakeSeqRecord(features=[make_feature("COX3", "MKT...")])
+  mock_fetch.return_value = {"ABC123": record}
+  result = asyncio.run(extract_cox3(MagicMock(), "Homo sapiens"))
   assert result == "MKT..."
 
+@patch("pull.core.summarize_accessions", return_value={})
 @patch("pull.core.search_species_sequences", return_value=[])
-def test_extract_cox3_no_ids(mock_search):
-  result = extract_cox3("Unknownus speciesus")
+def test_extract_cox3_no_ids(mock_search, mock_summary):
+  result = asyncio.run(extract_cox3(MagicMock(), "Unknownus speciesus"))
   assert result is None
 
+@patch("pull.core.summarize_accessions", return_value={})
 @patch("pull.core.search_species_sequences", return_value=["BADID"])
-@patch("pull.core.fetch_genbank", return_value=None)
-def test_extract_cox3_no_record(mock_fetch, mock_search):
-  result = extract_cox3("Homo sapiens")
+@patch("pull.core.fetch_cds_translations_many", return_value={})
+@patch("pull.core.fetch_genbank_many", return_value={})
+def test_extract_cox3_no_record(mock_fetch, mock_cds, mock_search, mock_summary):
+  result = asyncio.run(extract_cox3(MagicMock(), "Homo sapiens"))
   assert result is None
 
+@patch("pull.core.summarize_accessions", return_value={})
 @patch("pull.core.search_species_sequences", return_value=["ABC123"])
-@patch("pull.core.fetch_genbank")
-def test_extract_cox3_no_translation(mock_fetch, mock_search):
+@patch("pull.core.fetch_cds_translations_many", return_value={})
+@patch("pull.core.fetch_genbank_many")
+def test_extract_cox3_no_translation(mock_fetch, mock_cds, mock_search, mock_summary):
   record = FakeSeqRecord(features=[make_feature("COX3", None)])
-  mock_fetch.return_value = record
+  mock_fetch.return_value = {"ABC123": record}
   record.features[0].qualifiers.pop("translation", None)
-  result = extract_cox3("Homo sapiens")
-  assert result == "<No translation available>"
\ No newline at end of file
+  result = asyncio.run(extract_cox3(MagicMock(), "Homo sapiens"))
+  assert result == "<No translation available>"
+
+@patch("pull.core.summarize_accessions", return_value={})
+@patch("pull.core.fetch_genbank_many", return_value={})
+@patch("pull.core.fetch_cds_translations_many")
+@patch("pull.core.search_species_sequences")
+def test_extract_cox3_many_batches_fetches(mock_search, mock_cds, mock_fetch, mock_summary):
+  mock_search.side_effect = [["ABC123"], [], ["XYZ789"]]
+  mock_cds.return_value = {"ABC123": {"COX3": "MKT..."}, "XYZ789": {"COX3": "MFQ..."}}
+  species = ["Homo sapiens", "Unknownus speciesus", "Pan troglodytes"]
+  result = asyncio.run(extract_cox3_many(MagicMock(), species))
+  assert result == {
+    "Homo sapiens": "MKT...",
+    "Unknownus speciesus": None,
+    "Pan troglodytes": "MFQ...",
+  }
+  mock_cds.assert_called_once()
+  assert mock_cds.call_args.args[1] == ["ABC123", "XYZ789"]
+
+@patch("pull.core.summarize_accessions")
+@patch("pull.core.fetch_cds_translations_many")
+@patch("pull.core.search_species_sequences", return_value=["GENOME.1", "MRNA.1"])
+def test_extract_cox3_picks_smallest_record(mock_search, mock_cds, mock_summary):
+  mock_summary.return_value = {"GENOME.1": make_docsum(16569), "MRNA.1": make_docsum(1200)}
+  mock_cds.return_value = {"MRNA.1": {"COX3": "MKT..."}}
+  assert asyncio.run(extract_cox3(MagicMock(), "Homo sapiens")) == "MKT..."
+  assert mock_cds.call_args.args[1] == ["MRNA.1"]
+
+@patch("pull.core.fetch_genbank_many", return_value={})
+@patch("pull.core.summarize_accessions")
+@patch("pull.core.fetch_cds_translations_many")
+@patch("pull.core.search_species_sequences", return_value=["GENOME.1", "MRNA.1"])
+def test_extract_cox3_tries_next_record(mock_search, mock_cds, mock_summary, mock_fetch):
+  mock_summary.return_value = {"GENOME.1": make_docsum(16569), "MRNA.1": make_docsum(1200)}
+  # the smallest record has its CDS tagged under a synonym, so the genome is tried next
+  mock_cds.side_effect = [{"MRNA.1": {"COXIII": "MKT..."}}, {"GENOME.1": {"COX3": "MFQ..."}}]
+  assert asyncio.run(extract_cox3(MagicMock(), "Homo sapiens")) == "MFQ..."
+  assert [call.args[1] for call in mock_cds.call_args_list] == [["MRNA.1"], ["GENOME.1"]]
+
+@patch("pull.core.fetch_genbank_many", return_value={})
+@patch("pull.core.summarize_accessions")
+@patch("pull.core.fetch_cds_translations_many")
+@patch("pull.core.search_species_sequences", return_value=["GENOME.1", "MRNA.1"])
+def test_extract_cox3_runs_out_of_records(mock_search, mock_cds, mock_summary, mock_fetch):
+  mock_summary.return_value = {"GENOME.1": make_docsum(16569), "MRNA.1": make_docsum(1200)}
+  mock_cds.return_value = {}
+  assert asyncio.run(extract_cox3(MagicMock(), "Homo sapiens")) is None
+  assert mock_cds.call_count == 2
+
+@patch("pull.core.summarize_accessions", return_value={})
+@patch("pull.core.fetch_genbank_many", return_value={})
+@patch("pull.core.fetch_cds_translations_many")
+@patch("pull.core.search_species_sequences")
+def test_extract_cox3_many_deduplicates(mock_search, mock_cds, mock_fetch, mock_summary):
+  mock_search.side_effect = [["ABC123"], ["ABC123"]]
+  mock_cds.return_value = {"ABC123": {"COX3": "MKT..."}}
+  species = ["Homo sapiens", "Pan troglodytes", "Homo sapiens"]
+  result = asyncio.run(extract_cox3_many(MagicMock(), species))
+  assert result == {"Homo sapiens": "MKT...", "Pan troglodytes": "MKT..."}
+  assert mock_search.call_count == 2
+  assert mock_cds.call_args.args[1] == ["ABC123"]
+
+@patch("pull.core.summarize_accessions", return_value={})
+@patch("pull.core.fetch_genbank_many")
+@patch("pull.core.fetch_cds_translations_many")
+@patch("pull.core.search_species_sequences")
+def test_extract_cox3_many_reports_translations(mock_search, mock_cds, mock_fetch, mock_summary):
+  mock_search.side_effect = [["ABC123"], ["XYZ789"], []]
+  mock_cds.return_value = {"ABC123": {"COX3": "MKT..."}, "XYZ789": {}}
+  mock_fetch.return_value = {"XYZ789": FakeSeqRecord(features=[make_feature("COX3", "MFQ...")])}
+  found = []
+  species = ["Homo sapiens", "Pan troglodytes", "Unknownus speciesus"]
+  asyncio.run(extract_cox3_many(MagicMock(), species, lambda *entry: found.append(entry)))
+  assert found == [("Homo sapiens", "MKT..."), ("Pan troglodytes", "MFQ...")]
+
+def test_translation_writer_matches_json_dump(tmp_path):
+  translations = {"Homo sapiens": "MKT...", "Pan troglodytes": "MFQ..."}
+  path = tmp_path / "translations.json"
+  with TranslationWriter(path) as writer:
+    for species, translation in translations.items():
+      writer.write(species, translation)
+  assert path.read_text() == json.dumps(translations, indent=4)
+
+def test_translation_writer_empty(tmp_path):
+  path = tmp_path / "translations.json"
+  with TranslationWriter(path):
+    pass
+  assert json.loads(path.read_text()) == {}
+
+def test_load_species(tmp_path):
+  path = tmp_path / "species.txt"
+  path.write_text("Homo sapiens\n\nPan troglodytes\n")
+  assert load_species(path) == ["Homo sapiens", "Pan troglodytes"]
+
+def test_load_translations_interrupted(tmp_path):
+  path = tmp_path / "translations.json"
+  writer = TranslationWriter(path).__enter__()
+  writer.write("Homo sapiens", "MKT...")
+  writer._file.close()
+  assert load_translations(path) == {"Homo sapiens": "MKT..."}
+  assert load_translations(tmp_path / "missing.json") == {}
+  path.write_text("not json")
+  with pytest.raises(ValueError):
+    load_translations(path)
+
+@patch("pull.core.run")
+def test_main_resume(mock_run, tmp_path):
+  species = tmp_path / "species.txt"
+  species.write_text("Homo sapiens\nPan troglodytes\n")
+  output = tmp_path / "translations.json"
+  output.write_text(json.dumps({"Homo sapiens": "MKT..."}))
+  async def fake_run(species_names, on_translation):
+    on_translation("Pan troglodytes", "MFQ...")
+    return {"Pan troglodytes": "MFQ..."}
+  mock_run.side_effect = fake_run
+  main(["--input", str(species), "--output", str(output), "--resume"])
+  assert mock_run.call_args.args[0] == ["Pan troglodytes"]
+  assert json.loads(output.read_text()) == {"Homo sapiens": "MKT...", "Pan troglodytes": "MFQ..."}
+
+def test_main_resume_unreadable_output(tmp_path):
+  species = tmp_path / "species.txt"
+  species.write_text("Homo sapiens\n")
+  output = tmp_path / "translations.json"
+  output.write_text('{\n    "Homo sapiens": "MK')
+  with pytest.raises(SystemExit):
+    main(["--input", str(species), "--output", str(output), "--resume"])
+  assert output.read_text() == '{\n    "Homo sapiens": "MK'